@@ -3,16 +3,17 @@
 OCR Receipt Scanner API - Railway Deployment
 """
 import os
-import sys
 import logging
 import traceback
 import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime
 from flask import Flask, request, jsonify
 from werkzeug.utils import secure_filename
 import cv2
-import numpy as np
-from PIL import Image
 import pytesseract
 
 # Configure logging
@@ -22,6 +23,11 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
+# Create necessary directories once at start-up rather than on every request
+os.makedirs('data/uploads', exist_ok=True)
+os.makedirs('data/processed', exist_ok=True)
+os.makedirs('data/results', exist_ok=True)
+
 # Try to import enhanced scanner, fallback to basic OCR
 try:
     from enhanced_scanner import EnhancedReceiptScanner
@@ -40,6 +46,61 @@ except ImportError as e:
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'webp'}
 
+# Longest image side fed to basic OCR; Tesseract gains nothing from more
+MAX_OCR_DIM = 2000
+
+# Header/footer lines skipped by the regex item extractor, as one alternation
+ITEM_SKIP_RE = re.compile(
+    r'gst|cgst|sgst|igst|invoice|bill|receipt|subtotal|discount|phone|address|thank|visit|hsn|rate|quantity'
+    r'|avenue|supermarts|ltd|pvt|company|corp|manufacturer'
+    r'|cin|gstin|fssai|license|state|buyer|supplier'
+    r'|cashier|counter|operator|authorized|signatory'
+    r'|\d{10,}'  # Long numbers (phone, license numbers)
+    r'|^[*\-=+]{3,}'  # Decorative lines
+    r'|description of goods|terms of delivery|central tax|state tax',
+    re.IGNORECASE
+)
+
+# Enhanced item patterns for business invoices and receipts
+ITEM_LINE_PATTERNS = [re.compile(pattern, re.IGNORECASE) for pattern in [
+    # Business Invoice: "Ace A1-Smartphone" with amounts like "30,00,000.00"
+    r'^([A-Za-z][A-Za-z0-9\s\-\.]{3,40}?)\s+.*?(\d{1,3}(?:,\d{2,3})*\.\d{2})$',
+
+    # Standard retail: Item name followed by price
+    r'^([A-Za-z][A-Za-z\s]{2,30}?)\s+.*?(\d+\.\d{2})$',
+
+    # Numbered items "1) ITEM_NAME PRICE"
+    r'^\d+\)\s*([A-Za-z][A-Za-z\s]{2,30}?)\s+.*?(\d+\.\d{2})',
+
+    # Item with quantity "ITEM_NAME Qty: X Price: Y"
+    r'^([A-Za-z][A-Za-z\s]{2,30}?)\s+.*?qty.*?(\d+\.\d{2})',
+
+    # Product code + item name + price (HSN codes)
+    r'^\d{3,6}\s+([A-Za-z][A-Za-z\s\-]{2,30}?)\s+.*?(\d{1,3}(?:,\d{2,3})*\.\d{2})',
+
+    # Simple "ITEM PRICE" format
+    r'^([A-Za-z][A-Za-z\s]{2,20})\s+(\d+\.\d{2})$',
+
+    # Business format with batch info: "Ace A1-Smartphone Batch : Batch1"
+    r'^([A-Za-z][A-Za-z0-9\s\-]{3,30}?)\s+(?:batch|lot).*?(\d{1,3}(?:,\d{2,3})*\.\d{2})',
+]]
+
+# Enhanced date patterns for Indian formats, tried in order on lowercased text
+DATE_PATTERNS = [re.compile(pattern) for pattern in [
+    r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+    r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})',
+    r'(\d{2}/\d{2}/\d{4})',
+    r'bill dt[:\s]*(\d{2}/\d{2}/\d{4})'
+]]
+
+def find_date(text_lower):
+    """Return the first date matched by DATE_PATTERNS, or None."""
+    for pattern in DATE_PATTERNS:
+        match = pattern.search(text_lower)
+        if match:
+            return match.group(1)
+    return None
+
 def allowed_file(filename):
     """Check if file extension is allowed."""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -54,6 +115,34 @@ def health():
         'timestamp': datetime.now().isoformat()
     })
 
+# OCR results of recently scanned images keyed by the SHA-256 of the file,
+# so uploading the same receipt again skips OCR entirely
+OCR_CACHE_SIZE = 64
+ocr_cache = OrderedDict()
+ocr_cache_lock = threading.Lock()
+
+def cached_process_ocr(image_path):
+    """Process image using OCR, reusing the result of an identical earlier upload."""
+    with open(image_path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    
+    with ocr_cache_lock:
+        if digest in ocr_cache:
+            ocr_cache.move_to_end(digest)
+            logger.info(f"Using cached OCR result for {image_path}")
+            return ocr_cache[digest]
+    
+    result = process_ocr(image_path)
+    
+    # Failures are not cached so a retry runs OCR again
+    if 'error' not in result:
+        with ocr_cache_lock:
+            ocr_cache[digest] = result
+            if len(ocr_cache) > OCR_CACHE_SIZE:
+                ocr_cache.popitem(last=False)
+    
+    return result
+
 def process_ocr(image_path):
     """Process image using OCR and extract text."""
     try:
@@ -80,7 +169,7 @@ def process_ocr(image_path):
                     'items': extracted.items or []
                 }
                 
-                logger.info(f"Enhanced OCR result: {receipt_data}")
+                logger.debug("Enhanced OCR result: %s", receipt_data)
                 return receipt_data
             else:
                 logger.warning("Enhanced scanner returned no data, falling back to basic OCR")
@@ -88,13 +177,15 @@ def process_ocr(image_path):
         # Fallback to basic OCR processing
         logger.info("Using basic OCR processing")
         
-        # Load and preprocess image
-        image = cv2.imread(image_path)
-        if image is None:
+        # Load the image straight as grayscale; only luminance is used
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
             return {'error': 'Could not load image'}
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        # Downscale large photos so every later step touches fewer pixels
+        scale = MAX_OCR_DIM / max(gray.shape[:2])
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
         
         # Apply Gaussian blur to reduce noise
         blurred = cv2.GaussianBlur(gray, (5, 5), 0)
@@ -106,6 +197,7 @@ def process_ocr(image_path):
         text = pytesseract.image_to_string(thresh, config='--psm 6')
         
         # Basic text processing and extraction
+        text_lower = text.lower()
         lines = [line.strip() for line in text.split('\n') if line.strip()]
         
         # Try to extract basic receipt information
@@ -130,7 +222,7 @@ def process_ocr(image_path):
         receipt_data['total'] = None
         
         # First try D-Mart specific pattern
-        dmart_total_match = re.search(r'qty:\s*iy\s*(\d+\.\d{2})', text.lower())
+        dmart_total_match = re.search(r'qty:\s*iy\s*(\d+\.\d{2})', text_lower)
         if dmart_total_match:
             try:
                 receipt_data['total'] = float(dmart_total_match.group(1))
@@ -141,7 +233,7 @@ def process_ocr(image_path):
         # If D-Mart pattern didn't work, try general patterns
         if receipt_data['total'] is None:
             for pattern in total_patterns:
-                matches = re.findall(pattern, text.lower())
+                matches = re.findall(pattern, text_lower)
                 if matches:
                     try:
                         # Filter out obviously wrong amounts (too small or too large)
@@ -161,20 +253,7 @@ def process_ocr(image_path):
                     except (ValueError, TypeError):
                         continue
         
-        # Enhanced date patterns for Indian formats
-        date_patterns = [
-            r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-            r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})',
-            r'(\d{2}/\d{2}/\d{4})',
-            r'bill dt[:\s]*(\d{2}/\d{2}/\d{4})'
-        ]
-        
-        receipt_data['date'] = None
-        for pattern in date_patterns:
-            matches = re.findall(pattern, text.lower())
-            if matches:
-                receipt_data['date'] = matches[0]
-                break
+        receipt_data['date'] = find_date(text_lower)
         
         return receipt_data
         
@@ -220,13 +299,10 @@ def scan_receipt():
                 'timestamp': datetime.now().isoformat()
             }), 400
             
-        # Create directories
-        os.makedirs('data/uploads', exist_ok=True)
-        os.makedirs('data/processed', exist_ok=True)
-        
         # Save uploaded file
         filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        # Nanosecond time plus PID keeps names unique across concurrent workers
+        timestamp = f"{time.time_ns()}_{os.getpid()}"
         filename = f"{timestamp}_{filename}"
         filepath = os.path.join('data/uploads', filename)
         file.save(filepath)
@@ -234,9 +310,9 @@ def scan_receipt():
         logger.info(f"Processing receipt: {filename}")
         
         # Process the receipt using our OCR function
-        result = process_ocr(filepath)
+        result = cached_process_ocr(filepath)
         
-        logger.info(f"OCR result: {result}")
+        logger.debug("OCR result: %s", result)
         
         # Ensure all values are JSON serializable
         if 'error' in result:
@@ -327,17 +403,18 @@ def get_receipts():
         if not os.path.exists(receipts_dir):
             return jsonify({'receipts': []})
             
+        # scandir entries cache their stat result, so each file is stat'ed once
         receipts = []
-        for filename in os.listdir(receipts_dir):
-            if allowed_file(filename):
-                filepath = os.path.join(receipts_dir, filename)
-                stat = os.stat(filepath)
-                receipts.append({
-                    'filename': filename,
-                    'size': stat.st_size,
-                    'created': datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                    'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
-                })
+        with os.scandir(receipts_dir) as entries:
+            for entry in entries:
+                if allowed_file(entry.name):
+                    stat = entry.stat()
+                    receipts.append({
+                        'filename': entry.name,
+                        'size': stat.st_size,
+                        'created': datetime.fromtimestamp(stat.st_ctime).isoformat(),
+                        'modified': datetime.fromtimestamp(stat.st_mtime).isoformat()
+                    })
         
         return jsonify({
             'success': True,
@@ -370,13 +447,12 @@ def extract_data():
                 items = []
                 if extracted.items:
                     for item in extracted.items:
-                        if isinstance(item, dict):
-                            items.append({
-                                'name': item.get('name'),
-                                'quantity': item.get('quantity'),
-                                'price': item.get('unit_price'),
-                                'totalPrice': item.get('total_price'),
-                            })
+                        items.append({
+                            'name': item.name,
+                            'quantity': item.quantity,
+                            'price': item.unit_price,
+                            'totalPrice': item.total_price,
+                        })
                 return jsonify({
                     'success': True,
                     'data': {
@@ -474,19 +550,7 @@ def extract_data():
                     continue
         
         # Extract date
-        date = None
-        date_patterns = [
-            r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-            r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})',
-            r'(\d{2}/\d{2}/\d{4})',
-            r'bill dt[:\s]*(\d{2}/\d{2}/\d{4})'
-        ]
-        
-        for pattern in date_patterns:
-            matches = re.findall(pattern, text_lower)
-            if matches:
-                date = matches[0]
-                break
+        date = find_date(text_lower)
         
         # Extract items from D-Mart receipt
         items = []
@@ -547,45 +611,11 @@ def extract_data():
                 continue
             
             # Skip header/footer lines but allow business invoice items
-            skip_patterns = [
-                r'(gst|cgst|sgst|igst|invoice|bill|receipt|subtotal|discount|phone|address|thank|visit|hsn|rate|quantity)',
-                r'(avenue|supermarts|ltd|pvt|company|corp|manufacturer)',
-                r'(cin|gstin|fssai|license|state|buyer|supplier)',
-                r'(cashier|counter|operator|authorized|signatory)',
-                r'(\d{10,})',  # Long numbers (phone, license numbers)
-                r'^[*\-=+]{3,}',  # Decorative lines
-                r'(description of goods|terms of delivery|central tax|state tax)',
-            ]
-            
-            if any(re.search(pattern, line, re.IGNORECASE) for pattern in skip_patterns):
+            if ITEM_SKIP_RE.search(line):
                 continue
             
-            # Enhanced item patterns for business invoices and receipts
-            item_patterns = [
-                # Business Invoice: "Ace A1-Smartphone" with amounts like "30,00,000.00"
-                r'^([A-Za-z][A-Za-z0-9\s\-\.]{3,40}?)\s+.*?(\d{1,3}(?:,\d{2,3})*\.\d{2})$',
-                
-                # Standard retail: Item name followed by price
-                r'^([A-Za-z][A-Za-z\s]{2,30}?)\s+.*?(\d+\.\d{2})$',
-                
-                # Numbered items "1) ITEM_NAME PRICE"
-                r'^\d+\)\s*([A-Za-z][A-Za-z\s]{2,30}?)\s+.*?(\d+\.\d{2})',
-                
-                # Item with quantity "ITEM_NAME Qty: X Price: Y"
-                r'^([A-Za-z][A-Za-z\s]{2,30}?)\s+.*?qty.*?(\d+\.\d{2})',
-                
-                # Product code + item name + price (HSN codes)
-                r'^\d{3,6}\s+([A-Za-z][A-Za-z\s\-]{2,30}?)\s+.*?(\d{1,3}(?:,\d{2,3})*\.\d{2})',
-                
-                # Simple "ITEM PRICE" format
-                r'^([A-Za-z][A-Za-z\s]{2,20})\s+(\d+\.\d{2})$',
-                
-                # Business format with batch info: "Ace A1-Smartphone Batch : Batch1"
-                r'^([A-Za-z][A-Za-z0-9\s\-]{3,30}?)\s+(?:batch|lot).*?(\d{1,3}(?:,\d{2,3})*\.\d{2})',
-            ]
-            
-            for pattern in item_patterns:
-                match = re.search(pattern, line, re.IGNORECASE)
+            for pattern in ITEM_LINE_PATTERNS:
+                match = pattern.search(line)
                 if match:
                     try:
                         item_name = match.group(1).strip()
@@ -683,11 +713,6 @@ def too_large(e):
     return jsonify({'error': 'File too large. Maximum size is 16MB.'}), 413
 
 if __name__ == "__main__":
-    # Create necessary directories
-    os.makedirs('data/uploads', exist_ok=True)
-    os.makedirs('data/processed', exist_ok=True)
-    os.makedirs('data/results', exist_ok=True)
-    
     # Get port from environment variable for Railway deployment
     port = int(os.environ.get('PORT', 8080))
     debug = os.environ.get('FLASK_ENV') != 'production'
@@ -6,11 +6,19 @@ from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
 import json
+import time
+from dataclasses import asdict
 from datetime import datetime
 import logging
 from enhanced_scanner import EnhancedReceiptScanner
 import traceback
 
+# orjson is optional; it writes the result files much faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,6 +29,11 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 # Enable CORS for all routes
 CORS(app)
 
+# Create necessary directories once at start-up rather than on every request
+os.makedirs('data/uploads', exist_ok=True)
+os.makedirs('data/processed', exist_ok=True)
+os.makedirs('data/results', exist_ok=True)
+
 # Initialize the enhanced scanner
 scanner = EnhancedReceiptScanner()
 
@@ -53,11 +66,11 @@ def scan_receipt():
         
         # Save uploaded file
         filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        # Nanosecond time plus PID keeps names unique across concurrent workers
+        timestamp = f"{time.time_ns()}_{os.getpid()}"
         filename = f"{timestamp}_{filename}"
         filepath = os.path.join('data/uploads', filename)
         
-        os.makedirs('data/uploads', exist_ok=True)
         file.save(filepath)
         
         logger.info(f"Processing file: {filepath}")
@@ -74,7 +87,7 @@ def scan_receipt():
                 'total': extracted_data.total,
                 'subtotal': extracted_data.subtotal,
                 'tax': extracted_data.tax,
-                'items': extracted_data.items or [],
+                'items': [asdict(item) for item in extracted_data.items or []],
                 'payment_method': extracted_data.payment_method,
                 'receipt_number': extracted_data.receipt_number,
                 'confidence_score': extracted_data.confidence_score,
@@ -89,9 +102,12 @@ def scan_receipt():
         
         # Save result to database/file for tracking
         result_file = os.path.join('data/results', f"{timestamp}_result.json")
-        os.makedirs('data/results', exist_ok=True)
-        with open(result_file, 'w') as f:
-            json.dump(result, f, indent=2)
+        if orjson is not None:
+            with open(result_file, 'wb') as f:
+                f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+        else:
+            with open(result_file, 'w') as f:
+                json.dump(result, f, indent=2)
         
         logger.info(f"Scan completed successfully. Confidence: {extracted_data.confidence_score:.2f}")
         
@@ -120,46 +136,54 @@ def scan_receipts_batch():
         if not files:
             return jsonify({'error': 'No files provided'}), 400
         
-        results = []
-        
+        # Save every upload first so the receipts can be scanned concurrently
+        uploads = []
         for file in files:
             if file.filename == '' or not allowed_file(file.filename):
                 continue
             
             try:
-                # Save and process each file
                 filename = secure_filename(file.filename)
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+                timestamp = f"{time.time_ns()}_{os.getpid()}"
                 filename = f"{timestamp}_{filename}"
                 filepath = os.path.join('data/uploads', filename)
                 
                 file.save(filepath)
-                
-                # Scan the receipt
-                extracted_data = scanner.scan_receipt(filepath, save_processed=False)
-                
-                results.append({
-                    'filename': file.filename,
-                    'success': True,
-                    'data': {
-                        'merchant': extracted_data.merchant,
-                        'date': extracted_data.date,
-                        'total': extracted_data.total,
-                        'subtotal': extracted_data.subtotal,
-                        'tax': extracted_data.tax,
-                        'items': extracted_data.items or [],
-                        'payment_method': extracted_data.payment_method,
-                        'receipt_number': extracted_data.receipt_number,
-                        'confidence_score': extracted_data.confidence_score
-                    }
-                })
-                
+                uploads.append((file.filename, filepath, None))
             except Exception as e:
+                uploads.append((file.filename, None, e))
+        
+        # Scan the receipts; the scanner returns the exception for any that failed
+        scanned = iter(scanner.scan_receipts_batch(
+            [filepath for _, filepath, error in uploads if error is None], save_processed=False
+        ))
+        
+        results = []
+        for original_name, filepath, error in uploads:
+            extracted_data = next(scanned) if error is None else error
+            if isinstance(extracted_data, Exception):
                 results.append({
-                    'filename': file.filename,
+                    'filename': original_name,
                     'success': False,
-                    'error': str(e)
+                    'error': str(extracted_data)
                 })
+                continue
+            
+            results.append({
+                'filename': original_name,
+                'success': True,
+                'data': {
+                    'merchant': extracted_data.merchant,
+                    'date': extracted_data.date,
+                    'total': extracted_data.total,
+                    'subtotal': extracted_data.subtotal,
+                    'tax': extracted_data.tax,
+                    'items': [asdict(item) for item in extracted_data.items or []],
+                    'payment_method': extracted_data.payment_method,
+                    'receipt_number': extracted_data.receipt_number,
+                    'confidence_score': extracted_data.confidence_score
+                }
+            })
         
         return jsonify({
             'success': True,
@@ -207,7 +231,7 @@ def test_with_sample():
                         'total': extracted_data.total,
                         'subtotal': extracted_data.subtotal,
                         'tax': extracted_data.tax,
-                        'items': extracted_data.items or [],
+                        'items': [asdict(item) for item in extracted_data.items or []],
                         'confidence_score': extracted_data.confidence_score
                     }
                 })
@@ -260,11 +284,6 @@ def too_large(e):
     return jsonify({'error': 'File too large. Maximum size is 16MB.'}), 413
 
 if __name__ == '__main__':
-    # Create necessary directories
-    os.makedirs('data/uploads', exist_ok=True)
-    os.makedirs('data/processed', exist_ok=True)
-    os.makedirs('data/results', exist_ok=True)
-    
     # Get port from environment variable for Railway deployment
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') != 'production'
@@ -3,17 +3,179 @@ Enhanced Receipt Data Extractor with AI-powered parsing and multi-format support
 Supports Indian receipts, invoices, and various international formats.
 """
 import re
+import math
+import atexit
+import multiprocessing
+import string
 import datetime
-import json
-from typing import Dict, List, Any, Tuple, Optional, Union
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Optional
 from dateutil import parser as date_parser
-import numpy as np
 from dataclasses import dataclass
 import logging
+from enhanced_scanner import ExtractedData
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Keywords that anchor the amount extractors. Every total/tax/subtotal pattern
+# requires one of these words on the same line, so lines without an anchor are
+# never handed to the per-line regexes. The lookahead reports keywords that
+# overlap in OCR-merged words such as "amountax".
+_AMOUNT_ANCHOR_RE = re.compile(r'(?=(total|amount|pay|balance|gst|tax))')
+
+# Item table header keywords, serial-number column headers and the
+# subtotal/total line that closes the item section
+_ITEM_HEADER_RE = re.compile(r'item|description|particulars|qty|rate|amount|hsn')
+_SERIAL_HEADER_RE = re.compile(r's[rl]?\.no')
+_ITEM_SECTION_END_RE = re.compile(r'(?:sub)?total\s*[:\-]')
+
+# Item line layouts, tried in order by _parse_item_line_enhanced
+_ITEM_CODE_QTY_RATE_AMOUNT_RE = re.compile(r'(?:\d+)\s+([\w\s\-/&]+?)\s+(\d+(?:\.\d+)?)\s+(\d+(?:\.\d+)?)\s+(\d+(?:\.\d+)?)')
+_ITEM_QTY_RATE_AMOUNT_RE = re.compile(r'^([\w\s\-/&]+?)\s+(\d+(?:\.\d+)?)\s+(\d+(?:\.\d+)?)\s+(\d+(?:\.\d+)?)$')
+_ITEM_AMOUNT_RE = re.compile(r'^([\w\s\-/&]+?)\s+(\d+(?:\.\d+)?)$')
+
+# Lines that can never be items: tax rates and bare numbers/separators
+_TAX_RATE_LINE_RE = re.compile(r'(?:cgst|sgst|igst|tax)\s*[@%]')
+_NUMERIC_LINE_RE = re.compile(r'^[\d\s\-:.]+$')
+
+# Amount lines: totals (in priority order), GST components, subtotals and the
+# bare amount fallback. Case-insensitive so lines need no lowercasing first.
+_TOTAL_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'(?:grand\s+)?total\s*(?:amount)?\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
+    r'(?:net\s+)?amount\s*(?:payable|due)?\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
+    r'(?:final\s+)?total\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
+    r'(?:bill\s+)?amount\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
+    r'(?:you\s+)?pay\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
+    r'balance\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
+))
+# Union of the total patterns: a single search rules out every line that none
+# of them can match before the prioritised patterns are tried one by one
+_TOTAL_ANY_RE = re.compile('|'.join(f'(?:{pattern.pattern})' for pattern in _TOTAL_PATTERNS), re.IGNORECASE)
+_AMOUNT_RE = re.compile(r'(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)')
+# CGST, SGST and IGST lines in one pattern; group 1 names the component
+_GST_COMPONENT_RE = re.compile(r'([csi])gst\s*[@:]\s*(?:\d+(?:\.\d+)?)\s*%\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)', re.IGNORECASE)
+_TOTAL_TAX_RE = re.compile(r'(?:total\s+)?(?:tax|gst)\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)', re.IGNORECASE)
+_SUBTOTAL_PATTERNS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    r'sub\s*total\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
+    r'subtotal\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
+    r'(?:before\s+)?tax\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
+))
+
+# Characters stripped before date parsing
+_DATE_JUNK_RE = re.compile(r'[^\d\-/\.\s\w]')
+
+# Exact day-first formats tried before dateutil's much slower fuzzy parser
+_DATE_FORMATS = (
+    '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y',
+    '%d/%m/%y', '%d-%m-%y', '%d.%m.%y',
+    '%Y-%m-%d', '%Y/%m/%d',
+    '%d %b %Y', '%d %B %Y', '%d %b %y',
+    '%b %d %Y', '%b %d, %Y',
+)
+# Longer strings are never bare dates; fuzzy dateutil parsing of them is slow
+_FUZZY_DATE_MAX_LEN = 40
+
+# Merchant line filters: registration IDs, and the characters of lines that
+# hold only numbers (dates, times, phone numbers)
+_REGISTRATION_ID_RE = re.compile(r'\b(?:CIN|GSTIN|PAN|TIN|FSSAI)\b')
+_NUMBER_LINE_CHARS = string.digits + string.whitespace + '-:'
+
+# OCR text normalisation used by _clean_text
+_CURRENCY_RE = re.compile(r'[₹Rs\.]+')
+_DECIMAL_COMMA_RE = re.compile(r'(\d+),(\d{2})\b')
+
+_DECIMAL_COMMA = str.maketrans(',', '.')
+
+# Keyword-anchored fields: each entry pairs the literal keywords (located with
+# str.find) with the regex matched right after the keyword. Keywords of one
+# entry are tried in their listed order, as the original alternations were.
+_DATE_LABELS = (
+    (('bill', 'invoice', 'receipt'), re.compile(r'\s+(?:date|dt)\s*[:\.]?\s*([^\n]+)', re.IGNORECASE)),
+    (('date',), re.compile(r'\s*[:\.]?\s*([^\n]+)')),
+    (('dt',), re.compile(r'\s*[:\.]?\s*([^\n]+)')),
+    (('date',), re.compile(r'd?\s*[:\.]?\s*([^\n]+)', re.IGNORECASE)),
+)
+_RECEIPT_NUMBER_LABELS = (
+    (('receipt', 'bill', 'invoice'), re.compile(r'\s*(?:no|number|#)\s*[:\-]?\s*([A-Z0-9\-/]+)', re.IGNORECASE)),
+    (('ref', 'reference'), re.compile(r'\s*(?:no|number)?\s*[:\-]?\s*([A-Z0-9\-/]+)', re.IGNORECASE)),
+    (('transaction', 'txn'), re.compile(r'\s*(?:id|no)?\s*[:\-]?\s*([A-Z0-9\-/]+)', re.IGNORECASE)),
+)
+
+# Confidence points (out of 100) per extracted field, in the bit order used by
+# _calculate_extraction_confidence: merchant, date, total, tax, items,
+# multiple items, receipt number. Every field combination is scored up front.
+_CONFIDENCE_WEIGHTS = (20, 15, 25, 10, 20, 5, 5)
+_CONFIDENCE_BY_MASK = tuple(
+    min(sum(weight for bit, weight in enumerate(_CONFIDENCE_WEIGHTS) if mask >> bit & 1), 100) / 100
+    for mask in range(1 << len(_CONFIDENCE_WEIGHTS))
+)
+
+# Worker pool shared by extract_data_batch; created on first use so importing
+# this module never starts processes. Workers are spawned rather than forked
+# because the pool may be created from inside the threaded API server, where
+# a fork could copy held locks into the children.
+_batch_pool: Optional[ProcessPoolExecutor] = None
+_batch_pool_lock = threading.Lock()
+
+def _get_batch_pool() -> ProcessPoolExecutor:
+    """Return the shared extraction process pool, creating it if needed."""
+    global _batch_pool
+    if _batch_pool is None:
+        with _batch_pool_lock:
+            if _batch_pool is None:
+                _batch_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+                atexit.register(_batch_pool.shutdown)
+    return _batch_pool
+
+def _to_float(amount: str) -> float:
+    """Convert a regex-captured amount such as '12.50' or '12,50' to float.
+
+    The capture groups only admit digits with one optional separator, so
+    float() cannot raise here and no exception handling is needed.
+    """
+    return float(amount.translate(_DECIMAL_COMMA))
+
+def _parse_exact_date(date_str: str) -> Optional[datetime.datetime]:
+    """Parse date_str with the first matching entry of _DATE_FORMATS, if any."""
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(date_str, date_format)
+        except ValueError:
+            continue
+    return None
+
+def _match_after_keyword(text: str, text_lower: str, keywords: Tuple[str, ...],
+                         suffix_re: 're.Pattern') -> Optional['re.Match']:
+    """Return the first suffix_re match that directly follows one of keywords.
+
+    Keywords are located with str.find on the lowercased text and the regex
+    only runs at those offsets, which gives the same result as searching for
+    the combined keyword-plus-suffix pattern over the whole text. Lowercasing
+    can change the length of the text (e.g. 'İ'), which would shift the
+    offsets, so such text is searched with the combined pattern instead.
+    """
+    if len(text_lower) != len(text):
+        keyword_re = '(?:' + '|'.join(map(re.escape, keywords)) + ')'
+        return re.search(keyword_re + suffix_re.pattern, text, re.IGNORECASE)
+    
+    offsets = []
+    for keyword in keywords:
+        idx = text_lower.find(keyword)
+        while idx >= 0:
+            offsets.append((idx, idx + len(keyword)))
+            idx = text_lower.find(keyword, idx + 1)
+    
+    # Stable sort keeps the keyword order for hits at the same offset
+    offsets.sort(key=lambda offset: offset[0])
+    for _, end in offsets:
+        match = suffix_re.match(text, end)
+        if match:
+            return match
+    return None
+
+@dataclass(slots=True)
 class ItemData:
     """Container for extracted item information."""
     name: str
@@ -28,113 +190,153 @@ class EnhancedReceiptExtractor:
     def __init__(self):
         """Initialize the enhanced receipt data extractor."""
         # Indian currency patterns
-        self.currency_patterns = [
+        self.currency_patterns = [re.compile(pattern) for pattern in [
             r'₹\s*(\d+(?:[.,]\d+)?)',
             r'Rs\.?\s*(\d+(?:[.,]\d+)?)',
             r'INR\s*(\d+(?:[.,]\d+)?)',
             r'(\d+(?:[.,]\d+)?)\s*₹',
             r'(\d+(?:[.,]\d+)?)\s*Rs\.?'
-        ]
+        ]]
         
         # Date patterns for Indian formats
-        self.date_patterns = [
+        self.date_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in [
             r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',  # DD/MM/YYYY or MM/DD/YYYY
             r'(\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s+\d{2,4})',
             r'(\d{2,4}[/-]\d{1,2}[/-]\d{1,2})',  # YYYY/MM/DD
             r'(\d{1,2}\.?\d{1,2}\.?\d{2,4})',    # DD.MM.YYYY
-        ]
+        ]]
         
         # Common Indian merchant patterns
-        self.merchant_patterns = [
+        self.merchant_patterns = [re.compile(pattern, re.IGNORECASE | re.MULTILINE) for pattern in [
             r'(?:^|\n)\s*([A-Z][A-Z\s&]{2,30}(?:LTD|LIMITED|PVT|PRIVATE|MART|STORE|SHOP|SUPERMARKET)?)\s*(?:\n|$)',
             r'(?:^|\n)\s*([A-Z][A-Z\s&]{2,30})\s*(?:®|™|©)\s*(?:\n|$)',
             r'(?:^|\n)\s*(D[\s-]?MART|BIG\s*BAZAAR|RELIANCE|MORE|SPENCER\'?S|FOOD\s*WORLD)\s*(?:\n|$)',
-        ]
+        ]]
         
         # Tax patterns for Indian GST
-        self.tax_patterns = [
+        self.tax_patterns = [re.compile(pattern) for pattern in [
             r'(?:CGST|cgst)\s*[@:]\s*(\d+(?:\.\d+)?)\s*%\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
             r'(?:SGST|sgst)\s*[@:]\s*(\d+(?:\.\d+)?)\s*%\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
             r'(?:IGST|igst)\s*[@:]\s*(\d+(?:\.\d+)?)\s*%\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
             r'(?:GST|gst|TAX|tax)\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
             r'(?:Total\s+)?(?:Tax|GST)\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
-        ]
+        ]]
 
-    def extract_data(self, text: str, ocr_results: List = None) -> 'ExtractedData':
+    def extract_data(self, text: str, ocr_results: List = None, compute_confidence: bool = True) -> ExtractedData:
         """
         Extract structured data from OCR text using enhanced parsing.
         
         Args:
             text: Raw OCR text from receipt
             ocr_results: List of OCR results from different engines
+            compute_confidence: Whether to score the extraction; callers that
+                overwrite confidence_score themselves can skip it
             
         Returns:
             ExtractedData: Structured receipt data
         """
-        from enhanced_scanner import ExtractedData
-        
         # Clean and normalize text
         cleaned_text = self._clean_text(text)
         
+        # Split and lowercase the text once; every extractor shares the result
+        text_lower = cleaned_text.lower()
+        lines = cleaned_text.split('\n')
+        lines_lower = text_lower.split('\n')
+        
+        # Single pre-scan recording which lines carry amount keywords
+        anchors = self._scan_anchors(lines_lower)
+        
         # Initialize result
         result = ExtractedData()
         result.raw_text = text
         
         # Extract merchant information
-        result.merchant = self._extract_merchant_enhanced(cleaned_text)
+        result.merchant = self._extract_merchant_enhanced(cleaned_text, lines)
         
         # Extract date with multiple strategies
-        result.date = self._extract_date_enhanced(cleaned_text)
+        result.date = self._extract_date_enhanced(cleaned_text, text_lower)
         
         # Extract amounts (total, subtotal, tax)
-        amounts = self._extract_amounts_enhanced(cleaned_text)
+        amounts = self._extract_amounts_enhanced(lines, anchors)
         result.total = amounts.get('total')
         result.subtotal = amounts.get('subtotal')
         result.tax = amounts.get('tax')
         
         # Extract items with intelligent parsing
-        result.items = self._extract_items_enhanced(cleaned_text)
+        result.items = self._extract_items_enhanced(lines, lines_lower)
         
         # Extract additional information
-        result.receipt_number = self._extract_receipt_number(cleaned_text)
-        result.payment_method = self._extract_payment_method(cleaned_text)
+        result.receipt_number = self._extract_receipt_number(cleaned_text, text_lower)
+        result.payment_method = self._extract_payment_method(text_lower)
         
         # Calculate confidence score
-        result.confidence_score = self._calculate_extraction_confidence(result)
+        if compute_confidence:
+            result.confidence_score = self._calculate_extraction_confidence(result)
         
         # Validate and cross-check extracted data
         result = self._validate_and_correct(result, cleaned_text)
         
         return result
 
+    def extract_data_batch(self, texts: List[str]) -> List[ExtractedData]:
+        """
+        Extract structured data from several OCR texts in parallel.
+        
+        Regex parsing is CPU-bound and holds the GIL, so receipts are spread
+        across a shared pool of worker processes.
+        
+        Args:
+            texts: Raw OCR text of each receipt
+            
+        Returns:
+            List[ExtractedData]: Structured data in the same order as texts
+        """
+        if len(texts) < 2:
+            return [self.extract_data(text) for text in texts]
+        
+        return list(_get_batch_pool().map(self.extract_data, texts, chunksize=8))
+
     def _clean_text(self, text: str) -> str:
         """Clean and normalize OCR text."""
-        # Remove excessive whitespace (preserve line breaks)
+        # Substitutions that never cross a line break run once over the
+        # whole text instead of once per line
+        text = text.replace('|', 'I')
+        
+        # Normalize currency symbols
+        text = _CURRENCY_RE.sub('₹', text)
+        
         lines = text.split('\n')
         cleaned_lines = []
         for line in lines:
-            # Collapse internal whitespace within the line
-            line = re.sub(r'[ \t]+', ' ', line)
+            # Collapse internal whitespace and trim the line (preserve line breaks)
+            line = ' '.join(line.split())
             
             # Fix common OCR errors
-            line = line.replace('|', 'I')
             line = line.replace('0', 'O', 1)  # First 0 might be O in merchant name
             line = line.replace('5', 'S', 1)  # First 5 might be S in merchant name
             
-            # Normalize currency symbols
-            line = re.sub(r'[₹Rs\.]+', '₹', line)
-            
             # Fix decimal separators
-            line = re.sub(r'(\d+),(\d{2})\b', r'\1.\2', line)
+            line = _DECIMAL_COMMA_RE.sub(r'\1.\2', line)
             
-            cleaned_lines.append(line.strip())
+            cleaned_lines.append(line)
         
         return '\n'.join(cleaned_lines).strip()
 
-    def _extract_merchant_enhanced(self, text: str) -> Optional[str]:
+    def _scan_anchors(self, lines_lower: List[str]) -> Dict[str, List[int]]:
+        """Map each amount keyword to the indices of the lines containing it."""
+        anchors = defaultdict(list)
+        for i, line_lower in enumerate(lines_lower):
+            for word in set(_AMOUNT_ANCHOR_RE.findall(line_lower)):
+                anchors[word].append(i)
+        return anchors
+
+    def _anchored_lines(self, lines: List[str], anchors: Dict[str, List[int]], *words: str) -> List[str]:
+        """Return, in document order, the lines containing any of ``words``."""
+        indices = sorted({i for word in words for i in anchors.get(word, ())})
+        return [lines[i] for i in indices]
+
+    def _extract_merchant_enhanced(self, text: str, lines: List[str]) -> Optional[str]:
         """Enhanced merchant name extraction with multiple strategies."""
-        lines = text.split('\n')
-        
         # Strategy 1: Look for known Indian retailers
         known_merchants = {
             'D MART': 'D-Mart',
@@ -159,7 +361,7 @@ class EnhancedReceiptExtractor:
         
         # Strategy 2: Pattern-based extraction
         for pattern in self.merchant_patterns:
-            match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
+            match = pattern.search(text)
             if match:
                 merchant = match.group(1).strip()
                 if len(merchant) > 2 and not self._is_likely_not_merchant(merchant):
@@ -171,55 +373,53 @@ class EnhancedReceiptExtractor:
         for line in lines[:8]:
             line = line.strip()
             if len(line) > 3:
-                if not any(pattern in line.upper() for pattern in exclude_patterns):
-                    if not re.match(r'^[\d\s\-:]+$', line):
-                        if not any(x in line.lower() for x in ['tel:', 'phone', 'www.', 'http', 'email']):
+                line_upper = line.upper()
+                if not any(pattern in line_upper for pattern in exclude_patterns):
+                    if line.strip(_NUMBER_LINE_CHARS):
+                        line_lower = line.lower()
+                        if not any(x in line_lower for x in ['tel:', 'phone', 'www.', 'http', 'email']):
                             return line
         
         return None
 
-    def _extract_date_enhanced(self, text: str) -> Optional[str]:
+    def _extract_date_enhanced(self, text: str, text_lower: str) -> Optional[str]:
         """Enhanced date extraction with multiple strategies."""
         # Strategy 1: Look for labeled dates
-        date_labels = [
-            r'(?:bill|invoice|receipt)\s+(?:date|dt)\s*[:\.]?\s*([^\n]+)',
-            r'date\s*[:\.]?\s*([^\n]+)',
-            r'dt\s*[:\.]?\s*([^\n]+)',
-            r'dated?\s*[:\.]?\s*([^\n]+)'
-        ]
-        
-        for pattern in date_labels:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for keywords, suffix_re in _DATE_LABELS:
+            match = _match_after_keyword(text, text_lower, keywords, suffix_re)
             if match:
                 date_str = match.group(1).strip()
                 parsed_date = self._parse_date_string(date_str)
                 if parsed_date:
                     return parsed_date
         
-        # Strategy 2: Find dates in common formats
+        # Strategy 2: Find dates in common formats. Each pattern scans the
+        # whole text before the next is tried; one fused alternation would
+        # scan in text order instead and let an earlier, looser match pre-empt
+        # a date from a higher-priority pattern.
         for pattern in self.date_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+            matches = pattern.findall(text)
             for match in matches:
                 parsed_date = self._parse_date_string(match)
                 if parsed_date:
                     return parsed_date
         
-        # Strategy 3: Look for time patterns which often accompany dates
-        time_pattern = r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\s+(\d{1,2}:\d{2})'
-        match = re.search(time_pattern, text)
-        if match:
-            return self._parse_date_string(match.group(1))
-        
+        # A date printed next to a time is one of the first pattern's
+        # matches, so the loop above has already tried it
         return None
 
     def _parse_date_string(self, date_str: str) -> Optional[str]:
         """Parse various date string formats."""
         try:
             # Clean the date string
-            date_str = re.sub(r'[^\d\-/\.\s\w]', '', date_str).strip()
+            date_str = _DATE_JUNK_RE.sub('', date_str).strip()
             
-            # Try parsing with dateutil
-            parsed = date_parser.parse(date_str, fuzzy=True, dayfirst=True)
+            # Try the common exact formats first, then dateutil
+            parsed = _parse_exact_date(date_str)
+            if parsed is None:
+                if len(date_str) > _FUZZY_DATE_MAX_LEN:
+                    return None
+                parsed = date_parser.parse(date_str, fuzzy=True, dayfirst=True)
             
             # Validate the date (not too far in future or past)
             current_year = datetime.datetime.now().year
@@ -230,58 +430,43 @@ class EnhancedReceiptExtractor:
         
         return None
 
-    def _extract_amounts_enhanced(self, text: str) -> Dict[str, Optional[float]]:
+    def _extract_amounts_enhanced(self, lines: List[str], anchors: Dict[str, List[int]]) -> Dict[str, Optional[float]]:
         """Enhanced amount extraction for total, subtotal, and tax."""
         amounts = {'total': None, 'subtotal': None, 'tax': None}
         
-        lines = text.split('\n')
-        
         # Extract total amount
-        amounts['total'] = self._extract_total_enhanced(lines)
+        amounts['total'] = self._extract_total_enhanced(lines, anchors)
         
         # Extract tax amount
-        amounts['tax'] = self._extract_tax_enhanced(lines)
+        amounts['tax'] = self._extract_tax_enhanced(self._anchored_lines(lines, anchors, 'gst', 'tax'))
         
         # Extract subtotal
-        amounts['subtotal'] = self._extract_subtotal_enhanced(lines, amounts['total'], amounts['tax'])
+        amounts['subtotal'] = self._extract_subtotal_enhanced(
+            self._anchored_lines(lines, anchors, 'total', 'tax'), amounts['total'], amounts['tax']
+        )
         
         return amounts
 
-    def _extract_total_enhanced(self, lines: List[str]) -> Optional[float]:
+    def _extract_total_enhanced(self, lines: List[str], anchors: Dict[str, List[int]]) -> Optional[float]:
         """Enhanced total amount extraction."""
-        # Patterns for total amount (prioritized)
-        total_patterns = [
-            r'(?:grand\s+)?total\s*(?:amount)?\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
-            r'(?:net\s+)?amount\s*(?:payable|due)?\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
-            r'(?:final\s+)?total\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
-            r'(?:bill\s+)?amount\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
-            r'(?:you\s+)?pay\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
-            r'balance\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
-        ]
-        
         # Search from bottom to top (totals usually at bottom)
-        for line in reversed(lines):
-            line_lower = line.lower()
-            for pattern in total_patterns:
-                match = re.search(pattern, line_lower)
+        for line in reversed(self._anchored_lines(lines, anchors, 'total', 'amount', 'pay', 'balance')):
+            if not _TOTAL_ANY_RE.search(line):
+                continue
+            for pattern in _TOTAL_PATTERNS:
+                match = pattern.search(line)
                 if match:
-                    try:
-                        amount = float(match.group(1).replace(',', '.'))
-                        if 1 <= amount <= 100000:  # Reasonable range
-                            return amount
-                    except:
-                        continue
+                    amount = _to_float(match.group(1))
+                    if 1 <= amount <= 100000:  # Reasonable range
+                        return amount
         
         # Fallback: Look for the largest reasonable amount near the bottom
         for line in reversed(lines[-10:]):
-            amounts = re.findall(r'(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)', line)
+            amounts = _AMOUNT_RE.findall(line)
             for amount_str in amounts:
-                try:
-                    amount = float(amount_str.replace(',', '.'))
-                    if 10 <= amount <= 100000:
-                        return amount
-                except:
-                    continue
+                amount = _to_float(amount_str)
+                if 10 <= amount <= 100000:
+                    return amount
         
         return None
 
@@ -292,65 +477,30 @@ class EnhancedReceiptExtractor:
         
         # Look for GST breakdown
         for line in lines:
-            line_lower = line.lower()
-            
-            # CGST + SGST pattern
-            cgst_match = re.search(r'cgst\s*[@:]\s*(\d+(?:\.\d+)?)\s*%\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)', line_lower)
-            if cgst_match:
-                try:
-                    tax_amount = float(cgst_match.group(2).replace(',', '.'))
-                    total_tax += tax_amount
-                    found_tax = True
-                except:
-                    pass
-            
-            sgst_match = re.search(r'sgst\s*[@:]\s*(\d+(?:\.\d+)?)\s*%\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)', line_lower)
-            if sgst_match:
-                try:
-                    tax_amount = float(sgst_match.group(2).replace(',', '.'))
-                    total_tax += tax_amount
-                    found_tax = True
-                except:
-                    pass
-            
-            # IGST pattern
-            igst_match = re.search(r'igst\s*[@:]\s*(\d+(?:\.\d+)?)\s*%\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)', line_lower)
-            if igst_match:
-                try:
-                    tax_amount = float(igst_match.group(2).replace(',', '.'))
-                    total_tax += tax_amount
+            # CGST + SGST and IGST components; only the first of each counts
+            components = {}
+            for gst_match in _GST_COMPONENT_RE.finditer(line):
+                components.setdefault(gst_match.group(1).lower(), gst_match.group(2))
+            for component in 'csi':
+                if component in components:
+                    total_tax += _to_float(components[component])
                     found_tax = True
-                except:
-                    pass
             
             # Total tax pattern
-            total_tax_match = re.search(r'(?:total\s+)?(?:tax|gst)\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)', line_lower)
+            total_tax_match = _TOTAL_TAX_RE.search(line)
             if total_tax_match and not found_tax:
-                try:
-                    return float(total_tax_match.group(1).replace(',', '.'))
-                except:
-                    pass
+                return _to_float(total_tax_match.group(1))
         
         return total_tax if found_tax else None
 
     def _extract_subtotal_enhanced(self, lines: List[str], total: Optional[float], tax: Optional[float]) -> Optional[float]:
         """Extract subtotal amount."""
         # Look for explicit subtotal
-        subtotal_patterns = [
-            r'sub\s*total\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
-            r'subtotal\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
-            r'(?:before\s+)?tax\s*[:\-]?\s*(?:₹|Rs\.?)?\s*(\d+(?:[.,]\d+)?)',
-        ]
-        
         for line in lines:
-            line_lower = line.lower()
-            for pattern in subtotal_patterns:
-                match = re.search(pattern, line_lower)
+            for pattern in _SUBTOTAL_PATTERNS:
+                match = pattern.search(line)
                 if match:
-                    try:
-                        return float(match.group(1).replace(',', '.'))
-                    except:
-                        continue
+                    return _to_float(match.group(1))
         
         # Calculate from total - tax if both available
         if total is not None and tax is not None:
@@ -358,72 +508,64 @@ class EnhancedReceiptExtractor:
         
         return None
 
-    def _extract_items_enhanced(self, text: str) -> List[Dict[str, Any]]:
+    def _extract_items_enhanced(self, lines: List[str], lines_lower: List[str]) -> List[ItemData]:
         """Enhanced item extraction with intelligent parsing."""
         items = []
-        lines = text.split('\n')
         
         # Find item section boundaries
-        item_start, item_end = self._find_item_section(lines)
+        item_start, item_end = self._find_item_section(lines_lower)
         
         if item_start >= 0 and item_end > item_start:
-            # Process items in the identified section
+            # Process items in the identified section; _clean_text has
+            # already stripped every line
             for i in range(item_start, item_end):
-                line = lines[i].strip()
+                line = lines[i]
                 if not line:
                     continue
                 
-                item = self._parse_item_line_enhanced(line)
+                item = self._parse_item_line_enhanced(line, lines_lower[i])
                 if item:
                     items.append(item)
         
         # If no items found, try alternative parsing
         if not items:
-            items = self._extract_items_fallback(lines)
+            items = self._extract_items_fallback(lines, lines_lower)
         
         return items
 
-    def _find_item_section(self, lines: List[str]) -> Tuple[int, int]:
+    def _find_item_section(self, lines_lower: List[str]) -> Tuple[int, int]:
         """Find the start and end of the items section."""
         start_idx = -1
         end_idx = -1
         
-        # Look for header indicators
-        header_keywords = ['item', 'description', 'particulars', 'qty', 'rate', 'amount', 'hsn']
-        
-        for i, line in enumerate(lines):
-            line_lower = line.lower()
-            
-            # Check for item section start
+        for i, line_lower in enumerate(lines_lower):
+            # Check for item section start (two or more distinct header keywords)
             if start_idx == -1:
-                header_count = sum(1 for keyword in header_keywords if keyword in line_lower)
-                if header_count >= 2:
+                if len(set(_ITEM_HEADER_RE.findall(line_lower))) >= 2:
                     start_idx = i + 1
                     continue
                 
                 # Alternative start indicators
-                if any(x in line_lower for x in ['s.no', 'sr.no', 'sl.no']):
+                if _SERIAL_HEADER_RE.search(line_lower):
                     start_idx = i + 1
                     continue
             
             # Check for item section end
             if start_idx >= 0:
-                if any(x in line_lower for x in ['subtotal', 'total', 'tax', 'discount', 'amount payable']):
-                    if re.search(r'(?:sub)?total\s*[:\-]', line_lower):
-                        end_idx = i
-                        break
+                if _ITEM_SECTION_END_RE.search(line_lower):
+                    end_idx = i
+                    break
         
-        return start_idx, end_idx if end_idx > 0 else len(lines)
+        return start_idx, end_idx if end_idx > 0 else len(lines_lower)
 
-    def _parse_item_line_enhanced(self, line: str) -> Optional[Dict[str, Any]]:
+    def _parse_item_line_enhanced(self, line: str, line_lower: str) -> Optional[ItemData]:
         """Enhanced item line parsing with multiple patterns."""
         # Skip obvious non-item lines
-        if self._is_non_item_line(line):
+        if self._is_non_item_line(line, line_lower):
             return None
         
         # Pattern 1: HSN/Code + Description + Qty + Rate + Amount
-        pattern1 = r'(?:\d+)\s+([\w\s\-/&]+?)\s+(\d+(?:\.\d+)?)\s+(\d+(?:\.\d+)?)\s+(\d+(?:\.\d+)?)'
-        match = re.search(pattern1, line)
+        match = _ITEM_CODE_QTY_RATE_AMOUNT_RE.search(line)
         if match:
             name = match.group(1).strip()
             qty = float(match.group(2))
@@ -432,16 +574,10 @@ class EnhancedReceiptExtractor:
             
             # Validate: qty * rate should approximately equal amount
             if abs(qty * rate - amount) < max(1.0, amount * 0.1):
-                return {
-                    'name': name,
-                    'quantity': qty,
-                    'unit_price': rate,
-                    'total_price': amount
-                }
+                return ItemData(name=name, quantity=qty, unit_price=rate, total_price=amount)
         
         # Pattern 2: Description + Qty + Rate + Amount (no HSN)
-        pattern2 = r'^([\w\s\-/&]+?)\s+(\d+(?:\.\d+)?)\s+(\d+(?:\.\d+)?)\s+(\d+(?:\.\d+)?)$'
-        match = re.search(pattern2, line.strip())
+        match = _ITEM_QTY_RATE_AMOUNT_RE.match(line)
         if match:
             name = match.group(1).strip()
             if len(name) > 2:
@@ -449,36 +585,23 @@ class EnhancedReceiptExtractor:
                 rate = float(match.group(3))
                 amount = float(match.group(4))
                 
-                return {
-                    'name': name,
-                    'quantity': qty,
-                    'unit_price': rate,
-                    'total_price': amount
-                }
+                return ItemData(name=name, quantity=qty, unit_price=rate, total_price=amount)
         
         # Pattern 3: Description + Amount (quantity assumed as 1)
-        pattern3 = r'^([\w\s\-/&]+?)\s+(\d+(?:\.\d+)?)$'
-        match = re.search(pattern3, line.strip())
+        match = _ITEM_AMOUNT_RE.match(line)
         if match:
             name = match.group(1).strip()
             if len(name) > 2:
                 amount = float(match.group(2))
                 
-                return {
-                    'name': name,
-                    'quantity': 1.0,
-                    'unit_price': amount,
-                    'total_price': amount
-                }
+                return ItemData(name=name, quantity=1.0, unit_price=amount, total_price=amount)
         
         return None
 
-    def _is_non_item_line(self, line: str) -> bool:
+    def _is_non_item_line(self, line: str, line_lower: str) -> bool:
         """Check if line is likely not an item."""
-        line_lower = line.lower()
-        
         # Skip tax lines
-        if re.search(r'(?:cgst|sgst|igst|tax)\s*[@%]', line_lower):
+        if _TAX_RATE_LINE_RE.search(line_lower):
             return True
         
         # Skip header lines
@@ -490,48 +613,37 @@ class EnhancedReceiptExtractor:
             return True
         
         # Skip lines with only numbers or special characters
-        if re.match(r'^[\d\s\-:.]+$', line):
+        if _NUMERIC_LINE_RE.match(line):
             return True
         
         return False
 
-    def _extract_items_fallback(self, lines: List[str]) -> List[Dict[str, Any]]:
+    def _extract_items_fallback(self, lines: List[str], lines_lower: List[str]) -> List[ItemData]:
         """Fallback item extraction method."""
         items = []
         
         # Look for lines that might contain items
-        for line in lines:
-            line = line.strip()
+        for line, line_lower in zip(lines, lines_lower):
             if len(line) < 3:
                 continue
             
-            # Skip obvious non-item lines
-            if self._is_non_item_line(line):
-                continue
-            
-            # Try to extract item from line
-            item = self._parse_item_line_enhanced(line)
+            # Try to extract item from line; non-item lines are skipped inside
+            item = self._parse_item_line_enhanced(line, line_lower)
             if item:
                 items.append(item)
         
         return items
 
-    def _extract_receipt_number(self, text: str) -> Optional[str]:
+    def _extract_receipt_number(self, text: str, text_lower: str) -> Optional[str]:
         """Extract receipt/bill number."""
-        patterns = [
-            r'(?:receipt|bill|invoice)\s*(?:no|number|#)\s*[:\-]?\s*([A-Z0-9\-/]+)',
-            r'(?:ref|reference)\s*(?:no|number)?\s*[:\-]?\s*([A-Z0-9\-/]+)',
-            r'(?:transaction|txn)\s*(?:id|no)?\s*[:\-]?\s*([A-Z0-9\-/]+)',
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
+        for keywords, suffix_re in _RECEIPT_NUMBER_LABELS:
+            match = _match_after_keyword(text, text_lower, keywords, suffix_re)
             if match:
                 return match.group(1).strip()
         
         return None
 
-    def _extract_payment_method(self, text: str) -> Optional[str]:
+    def _extract_payment_method(self, text_lower: str) -> Optional[str]:
         """Extract payment method."""
         payment_methods = {
             'cash': ['cash', 'cash payment'],
@@ -541,8 +653,6 @@ class EnhancedReceiptExtractor:
             'net_banking': ['net banking', 'netbanking', 'online']
         }
         
-        text_lower = text.lower()
-        
         for method, keywords in payment_methods.items():
             if any(keyword in text_lower for keyword in keywords):
                 return method
@@ -554,11 +664,11 @@ class EnhancedReceiptExtractor:
         text_upper = text.upper()
         
         # Skip if contains ID patterns
-        if re.search(r'\b(?:CIN|GSTIN|PAN|TIN|FSSAI)\b', text_upper):
+        if _REGISTRATION_ID_RE.search(text_upper):
             return True
         
         # Skip if mostly numbers
-        if len(re.findall(r'\d', text)) > len(text) * 0.5:
+        if sum(map(str.isdecimal, text)) > len(text) * 0.5:
             return True
         
         # Skip if too short or too long
@@ -567,48 +677,28 @@ class EnhancedReceiptExtractor:
         
         return False
 
-    def _calculate_extraction_confidence(self, result: 'ExtractedData') -> float:
+    def _calculate_extraction_confidence(self, result: ExtractedData) -> float:
         """Calculate confidence score for extracted data."""
-        score = 0.0
-        max_score = 100.0
-        
-        # Merchant found
-        if result.merchant:
-            score += 20
-        
-        # Date found and valid
-        if result.date:
-            score += 15
-        
-        # Total amount found and reasonable
-        if result.total and 1 <= result.total <= 100000:
-            score += 25
-        
-        # Tax amount found
-        if result.tax:
-            score += 10
-        
-        # Items found
-        if result.items:
-            score += 20
-            # Bonus for multiple items
-            if len(result.items) > 1:
-                score += 5
-        
-        # Receipt number found
-        if result.receipt_number:
-            score += 5
-        
-        return min(score / max_score, 1.0)
+        items = result.items
+        mask = (
+            bool(result.merchant)                                          # Merchant found
+            | bool(result.date) << 1                                       # Date found and valid
+            | bool(result.total and 1 <= result.total <= 100000) << 2      # Total found and reasonable
+            | bool(result.tax) << 3                                        # Tax amount found
+            | bool(items) << 4                                             # Items found
+            | bool(items and len(items) > 1) << 5                          # Bonus for multiple items
+            | bool(result.receipt_number) << 6                             # Receipt number found
+        )
+        return _CONFIDENCE_BY_MASK[mask]
 
-    def _validate_and_correct(self, result: 'ExtractedData', text: str) -> 'ExtractedData':
+    def _validate_and_correct(self, result: ExtractedData, text: str) -> ExtractedData:
         """Validate and correct extracted data."""
         # Validate total vs items sum
         if result.items and result.total:
-            items_total = sum(item.get('total_price', item.get('unit_price', 0)) for item in result.items)
+            items_total = math.fsum(item.total_price or item.unit_price for item in result.items)
             
             # If items total is close to extracted total, use items total
-            if abs(items_total - result.total) < 5:
+            if math.isclose(items_total, result.total, abs_tol=5):
                 result.total = items_total
         
         # Validate subtotal + tax = total
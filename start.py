@@ -4,7 +4,6 @@ Direct Python server startup - bypasses all gunicorn issues
 """
 import os
 import sys
-import subprocess
 
 def main():
     """Start the Flask app directly"""
@@ -20,7 +19,16 @@ def main():
         from app import app
         port = int(os.environ.get('PORT', 8080))
         print(f"Starting server on port {port}")
-        app.run(host='0.0.0.0', port=port, debug=False)
+        
+        # Serve with waitress so OCR requests run on several threads at once;
+        # Flask's development server is the fallback if it is not installed
+        try:
+            from waitress import serve
+        except ImportError:
+            print("waitress not installed, using the Flask development server")
+            app.run(host='0.0.0.0', port=port, debug=False, threaded=True)
+        else:
+            serve(app, host='0.0.0.0', port=port, threads=max(4, os.cpu_count() or 1))
     except Exception as e:
         print(f"Error starting app: {e}")
         sys.exit(1)
@@ -0,0 +1,32 @@
+"""
+Regression tests for the enhanced receipt data extractor.
+"""
+import unittest
+
+from enhanced_extractor import EnhancedReceiptExtractor
+
+
+class TestEnhancedExtractor(unittest.TestCase):
+    """Tests for EnhancedReceiptExtractor."""
+
+    def setUp(self):
+        self.extractor = EnhancedReceiptExtractor()
+
+    def test_overlapping_amount_keywords(self):
+        """Keywords merged by OCR (amount + tax) must both anchor the line."""
+        anchors = self.extractor._scan_anchors(['amountax: 18.00'])
+        self.assertEqual(anchors['amount'], [0])
+        self.assertEqual(anchors['tax'], [0])
+
+        data = self.extractor.extract_data("SHOP\nItem 10.00\nAmountax: 18.00\nTotal: 118.00")
+        self.assertEqual(data.tax, 18.0)
+        self.assertEqual(data.total, 118.0)
+
+    def test_receipt_number_after_length_changing_lowercase(self):
+        """'İ' lowercases to two characters; labels after it must still match."""
+        data = self.extractor.extract_data("İSTANBUL STORE\nInvoice No: AB-123\nTotal: 50.00")
+        self.assertEqual(data.receipt_number, 'AB-123')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,20 +4,39 @@ Test script for the enhanced OCR system with sample bills.
 import os
 import sys
 import json
+from dataclasses import asdict
+from concurrent.futures import ProcessPoolExecutor
 from enhanced_scanner import EnhancedReceiptScanner
 import logging
 
+# orjson is optional; it writes the result file much faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Extensions of the sample images to scan
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp')
+
+# Scanner of the current worker process, created once by _init_worker
+_worker_scanner = None
+
+def _init_worker():
+    """Create the worker's scanner once; scanners cannot be sent between processes."""
+    global _worker_scanner
+    _worker_scanner = EnhancedReceiptScanner()
+
+def _scan_one(image_path):
+    """Scan one receipt in a worker process."""
+    return _worker_scanner.scan_receipt(image_path, save_processed=True)
+
 def test_enhanced_ocr():
     """Test the enhanced OCR system with sample bill images."""
     
-    # Initialize the enhanced scanner
-    logger.info("Initializing Enhanced Receipt Scanner...")
-    scanner = EnhancedReceiptScanner()
-    
     # Sample images directory
     sample_dir = 'assets/bill_img'
     
@@ -25,9 +44,10 @@ def test_enhanced_ocr():
         logger.error(f"Sample directory not found: {sample_dir}")
         return
     
-    # Get all image files
-    image_files = [f for f in os.listdir(sample_dir) 
-                   if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp'))]
+    # Get all image files; scandir entries carry their file type already
+    with os.scandir(sample_dir) as entries:
+        image_files = [entry.name for entry in entries
+                       if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)]
     
     if not image_files:
         logger.error("No image files found in sample directory")
@@ -37,75 +57,83 @@ def test_enhanced_ocr():
     
     results = []
     
-    for i, image_file in enumerate(image_files, 1):
-        logger.info(f"\n{'='*60}")
-        logger.info(f"Processing {i}/{len(image_files)}: {image_file}")
-        logger.info(f"{'='*60}")
+    # Receipts are independent, so scan them in parallel worker processes.
+    # Every worker holds its own scanner (OCR models and thread pools), so
+    # keep their number small and never above the number of images.
+    logger.info("Initializing Enhanced Receipt Scanner workers...")
+    image_paths = [os.path.join(sample_dir, image_file) for image_file in image_files]
+    max_workers = min(4, os.cpu_count() or 1, len(image_paths))
+    
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        futures = [executor.submit(_scan_one, image_path) for image_path in image_paths]
         
-        try:
-            image_path = os.path.join(sample_dir, image_file)
+        for i, (image_file, future) in enumerate(zip(image_files, futures), 1):
+            logger.info(f"\n{'='*60}")
+            logger.info(f"Processing {i}/{len(image_files)}: {image_file}")
+            logger.info(f"{'='*60}")
             
-            # Scan the receipt
-            extracted_data = scanner.scan_receipt(image_path, save_processed=True)
-            
-            # Display results
-            print(f"\n📄 RESULTS FOR: {image_file}")
-            print(f"{'─'*50}")
-            print(f"🏪 Merchant: {extracted_data.merchant or 'Not detected'}")
-            print(f"📅 Date: {extracted_data.date or 'Not detected'}")
-            print(f"💰 Total: ₹{extracted_data.total or 'Not detected'}")
-            print(f"💸 Tax: ₹{extracted_data.tax or 'Not detected'}")
-            print(f"🧾 Receipt #: {extracted_data.receipt_number or 'Not detected'}")
-            print(f"💳 Payment: {extracted_data.payment_method or 'Not detected'}")
-            print(f"📊 Confidence: {extracted_data.confidence_score:.1%}")
-            
-            if extracted_data.items:
-                print(f"\n🛒 ITEMS ({len(extracted_data.items)}):")
-                for j, item in enumerate(extracted_data.items, 1):
-                    name = item.get('name', 'Unknown')
-                    qty = item.get('quantity', 1)
-                    price = item.get('unit_price', 0)
-                    total = item.get('total_price', price)
-                    print(f"  {j}. {name}")
-                    print(f"     Qty: {qty} | Price: ₹{price} | Total: ₹{total}")
-            else:
-                print("\n🛒 ITEMS: None detected")
-            
-            # Store result
-            result = {
-                'file': image_file,
-                'success': True,
-                'data': {
-                    'merchant': extracted_data.merchant,
-                    'date': extracted_data.date,
-                    'total': extracted_data.total,
-                    'tax': extracted_data.tax,
-                    'items': extracted_data.items,
-                    'receipt_number': extracted_data.receipt_number,
-                    'payment_method': extracted_data.payment_method,
-                    'confidence_score': extracted_data.confidence_score
+            try:
+                # Wait for the receipt's scan
+                extracted_data = future.result()
+                
+                # Display results
+                print(f"\n📄 RESULTS FOR: {image_file}")
+                print(f"{'─'*50}")
+                print(f"🏪 Merchant: {extracted_data.merchant or 'Not detected'}")
+                print(f"📅 Date: {extracted_data.date or 'Not detected'}")
+                print(f"💰 Total: ₹{extracted_data.total or 'Not detected'}")
+                print(f"💸 Tax: ₹{extracted_data.tax or 'Not detected'}")
+                print(f"🧾 Receipt #: {extracted_data.receipt_number or 'Not detected'}")
+                print(f"💳 Payment: {extracted_data.payment_method or 'Not detected'}")
+                print(f"📊 Confidence: {extracted_data.confidence_score:.1%}")
+                
+                if extracted_data.items:
+                    print(f"\n🛒 ITEMS ({len(extracted_data.items)}):")
+                    for j, item in enumerate(extracted_data.items, 1):
+                        print(f"  {j}. {item.name}")
+                        print(f"     Qty: {item.quantity} | Price: ₹{item.unit_price} | Total: ₹{item.total_price}")
+                else:
+                    print("\n🛒 ITEMS: None detected")
+                
+                # Store result
+                result = {
+                    'file': image_file,
+                    'success': True,
+                    'data': {
+                        'merchant': extracted_data.merchant,
+                        'date': extracted_data.date,
+                        'total': extracted_data.total,
+                        'tax': extracted_data.tax,
+                        'items': [asdict(item) for item in extracted_data.items or []],
+                        'receipt_number': extracted_data.receipt_number,
+                        'payment_method': extracted_data.payment_method,
+                        'confidence_score': extracted_data.confidence_score
+                    }
                 }
-            }
-            results.append(result)
-            
-            print(f"\n✅ Processing completed successfully!")
-            
-        except Exception as e:
-            logger.error(f"Error processing {image_file}: {str(e)}")
-            print(f"\n❌ Error: {str(e)}")
-            
-            results.append({
-                'file': image_file,
-                'success': False,
-                'error': str(e)
-            })
+                results.append(result)
+                
+                print(f"\n✅ Processing completed successfully!")
+                
+            except Exception as e:
+                logger.error(f"Error processing {image_file}: {str(e)}")
+                print(f"\n❌ Error: {str(e)}")
+                
+                results.append({
+                    'file': image_file,
+                    'success': False,
+                    'error': str(e)
+                })
     
     # Save comprehensive results
     results_file = 'data/test_results.json'
     os.makedirs('data', exist_ok=True)
     
-    with open(results_file, 'w') as f:
-        json.dump(results, f, indent=2, default=str)
+    if orjson is not None:
+        with open(results_file, 'wb') as f:
+            f.write(orjson.dumps(results, default=str, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
+    else:
+        with open(results_file, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
     
     # Summary
     successful = sum(1 for r in results if r['success'])